@@ -4,59 +4,95 @@ Auction Analyzer - Finds optimal prices and good deals at auction
 """
 import pandas as pd
 import numpy as np
+import duckdb
 import re
 from typing import Dict, List, Tuple
 import requests
 from bs4 import BeautifulSoup
-import time
-import random
-from concurrent.futures import ThreadPoolExecutor
-import json
+import sqlite3
 import os
+import json
+
+# Item line: number, description, then optional retail and starting bid prices
+_ITEM_RE = re.compile(r'^(\d+)\s+(.*?)(?:\s+Retail\s+\$([0-9,]+))?(?:\s+Starting\s+Bid\s+\$([0-9,]+))?$')
+
+# Deal ratings from worst to best; _score_deals returns indexes into this list
+DEAL_RATINGS = ["Overpriced", "Fair", "Good Deal", "Great Deal"]
+
+
+def _score_deals(retail: np.ndarray, bid: np.ndarray, market: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute optimal price, deal score and rating code for every item in one pass"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # For simplicity, we'll use a weighted average of market and retail price
+        optimal_price = np.round(0.6 * market + 0.4 * retail)
+        
+        # Deal score: how good of a deal is the starting bid compared to optimal price
+        deal_score = np.round((optimal_price - bid) / optimal_price * 100, 1)
+    
+    # Bucket scores into DEAL_RATINGS (NaN scores fall through to the best bucket, as before)
+    rating_codes = np.select([deal_score <= 0, deal_score < 30, deal_score < 50], [0, 1, 2], default=3)
+    return optimal_price, deal_score, rating_codes
+
 
 class AuctionAnalyzer:
     def __init__(self, data_file: str):
         """Initialize the analyzer with data file path"""
         self.data_file = data_file
         self.df = None
+        self._analyzed = False
+        self.con = duckdb.connect(":memory:")
         self.market_prices = {}
         
+        # Seeded generator so simulated prices are reproducible across runs
+        self._rng = np.random.default_rng(42)
+        
         # Create cache directory if it doesn't exist
         os.makedirs("cache", exist_ok=True)
-        self.cache_file = "cache/market_prices.json"
+        self.cache_file = "cache/market_prices.db"
+        self.legacy_cache_file = "cache/market_prices.json"
         
-        # Load cache if it exists
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, 'r') as f:
-                self.market_prices = json.load(f)
+        # Open (or create) the SQLite cache and load it into memory
+        self.cache_con = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.cache_con.execute(
+            "CREATE TABLE IF NOT EXISTS market_prices (description TEXT PRIMARY KEY, market_price NUMERIC)"
+        )
+        self._migrate_json_cache()
+        self.market_prices = dict(self.cache_con.execute("SELECT description, market_price FROM market_prices"))
+        
+    def _migrate_json_cache(self) -> None:
+        """Copy the prices of the old JSON cache file into an empty cache database"""
+        if not os.path.exists(self.legacy_cache_file):
+            return
+        if self.cache_con.execute("SELECT 1 FROM market_prices LIMIT 1").fetchone():
+            return
+        with open(self.legacy_cache_file, 'r') as f:
+            legacy_cache = json.load(f)
+        # The market scraper's results share this file; only plain prices belong here
+        prices = {
+            description: price for description, price in legacy_cache.items()
+            if isinstance(price, (int, float)) and not isinstance(price, bool)
+        }
+        self.save_cache(prices)
         
     def parse_data(self) -> pd.DataFrame:
         """Parse the auction data file into a structured DataFrame"""
-        items = []
-        
-        with open(self.data_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line == "INTERMISSION":
-                    continue
-                    
-                # Extract item number and description
-                match = re.match(r'^(\d+)\s+(.*?)(?:\s+Retail\s+\$([0-9,]+))?(?:\s+Starting\s+Bid\s+\$([0-9,]+))?$', line)
-                if match:
-                    item_num, description, retail, starting_bid = match.groups()
-                    
-                    # Clean the values
-                    retail = int(retail.replace(',', '')) if retail else None
-                    starting_bid = int(starting_bid.replace(',', '')) if starting_bid else None
-                    
-                    items.append({
-                        'item_number': int(item_num),
-                        'description': description,
-                        'retail_price': retail,
-                        'starting_bid': starting_bid
-                    })
-                
-        self.df = pd.DataFrame(items)
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            lines = pd.Series(f.read().splitlines()).str.strip()
+        lines = lines[lines.str.len().gt(0) & lines.ne("INTERMISSION")]
+
+        # Extract item number, description and prices for every line in one pass
+        parsed = lines.str.extract(_ITEM_RE)
+        parsed.columns = ['item_number', 'description', 'retail_price', 'starting_bid']
+        parsed = parsed.dropna(subset=['item_number']).reset_index(drop=True)
+
+        # Clean the values; whole-dollar prices fit in Int32 (missing prices become <NA>)
+        parsed['item_number'] = parsed['item_number'].astype('int64')
+        parsed['description'] = parsed['description'].astype('category')
+        for col in ('retail_price', 'starting_bid'):
+            parsed[col] = pd.to_numeric(parsed[col].str.replace(',', '', regex=False)).astype('Int32')
+
+        self.df = parsed
+        self._analyzed = False
         return self.df
     
     def search_online_price(self, item_description: str) -> float:
@@ -76,97 +112,126 @@ class AuctionAnalyzer:
             if not item_row.empty:
                 retail = item_row['retail_price'].values[0]
                 # Add some randomness to simulate different market conditions
-                market_multiplier = random.uniform(0.85, 1.1)
+                market_multiplier = self._rng.uniform(0.85, 1.1)
                 market_price = round(retail * market_multiplier)
                 
                 # Cache the result
                 self.market_prices[item_description] = market_price
-                with open(self.cache_file, 'w') as f:
-                    json.dump(self.market_prices, f)
+                self.save_cache({item_description: market_price})
                     
                 return market_price
         
         return None
     
     def get_all_market_prices(self) -> None:
-        """Get market prices for all items using multithreading"""
+        """Get market prices for all items, simulating any that are not cached"""
         if self.df is None:
             self.parse_data()
             
-        def get_price(row):
-            time.sleep(0.1)  # To avoid overwhelming API/websites in a real implementation
-            return self.search_online_price(row['description'])
-            
         print("Fetching market prices... (simulated for this demo)")
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            market_prices = list(executor.map(get_price, self.df.to_dict('records')))
+        
+        # One bulk cache lookup; only the misses are simulated, in one vectorized pass
+        descriptions = self.df['description']
+        market_prices = descriptions.map(self.market_prices)
+        needs_price = market_prices.isna() & self.df['retail_price'].notna()
+        uncached = self.df.loc[needs_price, ['description', 'retail_price']].drop_duplicates('description')
+        if not uncached.empty:
+            simulated = self._simulate_market_prices(uncached['retail_price'].to_numpy())
+            new_prices = dict(zip(uncached['description'], simulated.tolist()))
+            self.market_prices.update(new_prices)
+            market_prices = descriptions.map(self.market_prices)
+            self.save_cache(new_prices)
             
-        self.df['market_price'] = market_prices
+        # np.asarray so a categorical description column doesn't yield a categorical price column
+        self.df['market_price'] = np.asarray(market_prices, dtype='float32')
+        
+    def _simulate_market_prices(self, retail_prices: np.ndarray) -> np.ndarray:
+        """Simulate market prices from retail prices with some randomness"""
+        # Add some randomness to simulate different market conditions
+        market_multiplier = self._rng.uniform(0.85, 1.1, size=len(retail_prices))
+        return np.round(retail_prices * market_multiplier).astype('int64')
+        
+    def save_cache(self, prices: Dict[str, float]) -> None:
+        """Insert or update the given prices in the on-disk cache"""
+        with self.cache_con:
+            self.cache_con.executemany(
+                "INSERT OR REPLACE INTO market_prices (description, market_price) VALUES (?, ?)",
+                prices.items(),
+            )
         
     def calculate_optimal_price(self) -> pd.DataFrame:
         """Calculate the optimal price for each item"""
         if 'market_price' not in self.df.columns:
             self.get_all_market_prices()
             
+        retail = self.df['retail_price'].to_numpy(dtype='float64', na_value=np.nan)
+        bid = self.df['starting_bid'].to_numpy(dtype='float64', na_value=np.nan)
+        market = self.df['market_price'].to_numpy(dtype='float64')
+        
         # Calculate various price metrics
-        self.df['bid_to_retail_ratio'] = self.df['starting_bid'] / self.df['retail_price']
-        self.df['market_to_retail_ratio'] = self.df['market_price'] / self.df['retail_price']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.df['bid_to_retail_ratio'] = bid / retail
+            self.df['market_to_retail_ratio'] = market / retail
         
-        # Calculate optimal price based on various factors
-        # For simplicity, we'll use a weighted average of market and retail price
-        self.df['optimal_price'] = (0.6 * self.df['market_price'] + 0.4 * self.df['retail_price']).round()
-        
-        # Calculate deal score: how good of a deal is the starting bid compared to optimal price
-        self.df['deal_score'] = ((self.df['optimal_price'] - self.df['starting_bid']) / self.df['optimal_price'] * 100).round(1)
-        
-        # Classify deals
-        def classify_deal(score):
-            if score <= 0:
-                return "Overpriced"
-            elif score < 30:
-                return "Fair"
-            elif score < 50:
-                return "Good Deal"
-            else:
-                return "Great Deal"
-                
-        self.df['deal_rating'] = self.df['deal_score'].apply(classify_deal)
+        optimal_price, deal_score, rating_codes = _score_deals(retail, bid, market)
+        self.df['optimal_price'] = optimal_price
+        self.df['deal_score'] = deal_score
+        self.df['deal_rating'] = pd.Categorical.from_codes(rating_codes, categories=DEAL_RATINGS, ordered=True)
+        
+        # Expose the scored items to DuckDB for the ranking queries
+        self.con.register("deals", self.df)
+        self._analyzed = True
         
         return self.df
     
+    def ensure_analysis(self) -> None:
+        """Parse and score the data unless that has already been done"""
+        if self._analyzed:
+            return
+        if self.df is None:
+            self.parse_data()
+        self.calculate_optimal_price()
+    
     def get_top_deals(self, n: int = 10) -> pd.DataFrame:
         """Get the top N deals sorted by deal score"""
-        if 'deal_score' not in self.df.columns:
-            self.calculate_optimal_price()
+        self.ensure_analysis()
             
-        return self.df.sort_values('deal_score', ascending=False).head(n)
+        return self.con.execute(
+            "SELECT * FROM deals ORDER BY deal_score DESC LIMIT ?", [n]
+        ).fetchdf()
     
     def get_all_deals(self) -> Dict[str, pd.DataFrame]:
         """Get all deals categorized by rating"""
-        if 'deal_rating' not in self.df.columns:
-            self.calculate_optimal_price()
+        self.ensure_analysis()
             
+        # Sort once in DuckDB, then split the ranked rows by rating
+        ranked = self.con.execute(
+            "SELECT * FROM deals ORDER BY deal_rating, deal_score DESC"
+        ).fetchdf()
+        
+        # One groupby pass instead of a mask scan per rating; empty ratings still get a frame
+        groups = dict(iter(ranked.groupby('deal_rating', sort=False, observed=True)))
         result = {}
         for rating in ['Great Deal', 'Good Deal', 'Fair', 'Overpriced']:
-            result[rating] = self.df[self.df['deal_rating'] == rating].sort_values('deal_score', ascending=False)
+            result[rating] = groups.get(rating, ranked.iloc[0:0])
             
         return result
     
     def export_results(self, output_file: str = "auction_analysis.csv") -> None:
         """Export results to CSV"""
-        if 'deal_rating' not in self.df.columns:
-            self.calculate_optimal_price()
+        self.ensure_analysis()
             
         self.df.to_csv(output_file, index=False)
         print(f"Results exported to {output_file}")
         
     def print_summary(self) -> None:
         """Print summary of analysis"""
-        if 'deal_rating' not in self.df.columns:
-            self.calculate_optimal_price()
+        self.ensure_analysis()
             
         total = len(self.df)
         deal_counts = self.df['deal_rating'].value_counts()
+        # The categorical counts every rating; only list the ones that occur
+        deal_counts = deal_counts[deal_counts > 0]
         
         print("\n===== AUCTION ANALYSIS SUMMARY =====")
         print(f"Total items analyzed: {total}")
@@ -177,15 +242,18 @@ class AuctionAnalyzer:
             
         print("\nTop 5 deals:")
         top_deals = self.get_top_deals(5)
-        for _, row in top_deals.iterrows():
-            print(f"  #{row['item_number']}: {row['description']} - {row['deal_rating']} (Score: {row['deal_score']})")
-            print(f"    Starting bid: ${row['starting_bid']} | Optimal price: ${row['optimal_price']} | Retail: ${row['retail_price']}")
+        self._print_deals(top_deals)
             
         print("\nWorst 5 deals:")
-        worst_deals = self.df.sort_values('deal_score').head(5)
-        for _, row in worst_deals.iterrows():
-            print(f"  #{row['item_number']}: {row['description']} - {row['deal_rating']} (Score: {row['deal_score']})")
-            print(f"    Starting bid: ${row['starting_bid']} | Optimal price: ${row['optimal_price']} | Retail: ${row['retail_price']}")
+        worst_deals = self.df.nsmallest(5, 'deal_score')
+        self._print_deals(worst_deals)
+            
+    def _print_deals(self, deals: pd.DataFrame) -> None:
+        """Print a two-line summary for each deal"""
+        columns = ['item_number', 'description', 'deal_rating', 'deal_score', 'starting_bid', 'optimal_price', 'retail_price']
+        for item_number, description, deal_rating, deal_score, starting_bid, optimal_price, retail_price in deals[columns].itertuples(index=False, name=None):
+            print(f"  #{item_number}: {description} - {deal_rating} (Score: {deal_score})")
+            print(f"    Starting bid: ${starting_bid} | Optimal price: ${optimal_price} | Retail: ${retail_price}")
             
 
 if __name__ == "__main__":
@@ -3,188 +3,389 @@
 Auction CLI - Command-line interface for auction analysis
 """
 import argparse
+import glob
+import hashlib
 import os
-import pandas as pd
-from tabulate import tabulate
-from duckdb_analyzer import DuckDBAnalyzer
+import sys
+import time
+import unicodedata
 
+# Columns shown as dollar amounts in the item details view
+MONEY_COLUMNS = ['retail_price', 'starting_bid', 'market_price', 'median_price',
+                 'min_price', 'max_price', 'optimal_price']
 
-def print_table(df, max_rows=None):
-    """Print dataframe as a pretty table"""
-    if max_rows:
-        df = df.head(max_rows)
-    print(tabulate(df, headers='keys', tablefmt='pretty', showindex=False))
+# Fallbacks for missing values in the item details view
+ITEM_DEFAULTS = {**dict.fromkeys(MONEY_COLUMNS, 0.0), 'deal_score': 0.0,
+                 'data_confidence': 0, 'top_condition': 'Unknown'}
 
+# Subcommands understood by the CLI
+COMMANDS = ('summary', 'top', 'category', 'rating', 'item', 'export', 'visualize')
 
-def main():
+# Directory holding the per-data-file analysis databases; bump the version when
+# the analyzer's table layout changes so older files are not reused
+ANALYSIS_CACHE_DIR = 'cache'
+ANALYSIS_CACHE_VERSION = 1
+
+
+def _display_width(text):
+    """Return the terminal columns text takes up, measured as tabulate does"""
+    # Wide East Asian characters take two columns and combining marks none
+    if text.isascii():
+        return len(text)
+    return sum(
+        0 if unicodedata.combining(ch) else 2 if unicodedata.east_asian_width(ch) in 'WF' else 1
+        for ch in text
+    )
+
+
+def _center(text, width):
+    """Center text in width, putting any odd space on the right (as tabulate does)"""
+    pad = width - _display_width(text)
+    left = pad // 2
+    return ' ' * left + text + ' ' * (pad - left)
+
+
+def _cell(value):
+    """Render a table cell; None is left blank, as tabulate does"""
+    return '' if value is None else str(value)
+
+
+def print_table(df):
+    """Print dataframe as a pretty table, writing one row at a time
+    
+    Callers limit rows at the source (SQL LIMIT), so every row given is printed.
+    """
+    # Size each column from its header and string values, without rendering the table
+    columns = [str(c) for c in df.columns]
+    widths = [
+        max([_display_width(name)] + [_display_width(_cell(v)) for v in df[col].tolist()])
+        for name, col in zip(columns, df.columns)
+    ]
+    border = '+' + '+'.join('-' * (w + 2) for w in widths) + '+\n'
+    
+    def render(values):
+        return '| ' + ' | '.join(_center(v, w) for v, w in zip(values, widths)) + ' |\n'
+    
+    write = sys.stdout.write
+    write(border)
+    write(render(columns))
+    write(border)
+    for row in df.itertuples(index=False, name=None):
+        write(render([_cell(v) for v in row]))
+    write(border)
+
+
+def _analysis_cache_prefix(data_file):
+    """Return the file name prefix shared by every cached analysis of data_file"""
+    path_key = hashlib.sha256(os.path.abspath(data_file).encode()).hexdigest()[:16]
+    return os.path.join(ANALYSIS_CACHE_DIR, f"analysis_{path_key}_")
+
+
+def _analysis_cache_file(data_file):
+    """Return the DuckDB file caching the analysis of data_file in its current version"""
+    from market_scraper import REVERB_API_TOKEN, USE_SANDBOX
+    
+    # Prices come from the live API, the sandbox or the simulation depending on the
+    # settings, so an analysis is only reused under the settings it was built with
+    stat = os.stat(data_file)
+    version = (
+        f"{ANALYSIS_CACHE_VERSION}:{stat.st_mtime_ns}:{stat.st_size}"
+        f":{bool(REVERB_API_TOKEN)}:{USE_SANDBOX}"
+    )
+    key = hashlib.sha256(version.encode()).hexdigest()[:16]
+    return f"{_analysis_cache_prefix(data_file)}{key}.duckdb"
+
+
+def _prune_analysis_cache(data_file, keep):
+    """Delete the cached analyses of data_file other than keep"""
+    stale = set(glob.glob(glob.escape(_analysis_cache_prefix(data_file)) + "*.duckdb"))
+    stale.discard(keep)
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open in another run; a later run removes it
+            pass
+
+
+def _cache_is_fresh(cache_file):
+    """Check that cache_file exists and is younger than the market price cache expiry"""
+    from market_scraper import CACHE_EXPIRY_DAYS
+    
+    if not os.path.exists(cache_file):
+        return False
+    max_age = CACHE_EXPIRY_DAYS * 86400
+    return time.time() - os.path.getmtime(cache_file) < max_age
+
+
+def _find_command(argv):
+    """Return the subcommand named in argv, or None when every subparser is needed"""
+    tokens = iter(argv)
+    for token in tokens:
+        if token == '--data-file':
+            next(tokens, None)
+        elif token.startswith('--data-file=') or token == '--refresh':
+            continue
+        elif token in COMMANDS:
+            return token
+        else:
+            # Top-level help, a typo or a missing command: build everything so
+            # argparse can list all commands
+            return None
+    return None
+
+
+def _build_parser(command=None):
+    """Build the argument parser, adding only the subparser for command when given"""
     parser = argparse.ArgumentParser(description='Music Auction Analysis CLI')
     
     # Main command arguments
     parser.add_argument('--data-file', type=str, default='data.txt',
                         help='Path to auction data file')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Rebuild the cached analysis instead of reusing it')
     
     # Create subparsers for different commands
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
+    def wanted(name):
+        return command is None or command == name
+    
     # Summary command
-    summary_parser = subparsers.add_parser('summary', help='Show analysis summary')
+    if wanted('summary'):
+        subparsers.add_parser('summary', help='Show analysis summary')
     
     # Top deals command
-    top_parser = subparsers.add_parser('top', help='Show top deals')
-    top_parser.add_argument('--count', type=int, default=10,
-                           help='Number of deals to show')
+    if wanted('top'):
+        top_parser = subparsers.add_parser('top', help='Show top deals')
+        top_parser.add_argument('--count', type=int, default=10,
+                               help='Number of deals to show')
     
     # Category command
-    category_parser = subparsers.add_parser('category', help='Show deals by category')
-    category_parser.add_argument('category', type=str, 
-                                help='Category to filter by (e.g., "Electric Guitar")')
+    if wanted('category'):
+        category_parser = subparsers.add_parser('category', help='Show deals by category')
+        category_parser.add_argument('category', type=str, 
+                                    help='Category to filter by, matched case-insensitively (e.g., "Electric Guitar" or "guitar")')
     
     # Rating command
-    rating_parser = subparsers.add_parser('rating', help='Show deals by rating')
-    rating_parser.add_argument('rating', type=str, choices=['Great Deal', 'Good Deal', 'Fair Deal', 'Overpriced'],
-                             help='Rating to filter by')
+    if wanted('rating'):
+        rating_parser = subparsers.add_parser('rating', help='Show deals by rating')
+        rating_parser.add_argument('rating', type=str, choices=['Great Deal', 'Good Deal', 'Fair Deal', 'Overpriced'],
+                                 help='Rating to filter by')
     
     # Item command
-    item_parser = subparsers.add_parser('item', help='Show details for a specific item')
-    item_parser.add_argument('item_number', type=int, help='Item number to show')
+    if wanted('item'):
+        item_parser = subparsers.add_parser('item', help='Show details for a specific item')
+        item_parser.add_argument('item_number', type=int, help='Item number to show')
     
     # Export command
-    export_parser = subparsers.add_parser('export', help='Export analysis results')
-    export_parser.add_argument('--output-dir', type=str, default='results',
-                              help='Directory to save results')
+    if wanted('export'):
+        export_parser = subparsers.add_parser('export', help='Export analysis results')
+        export_parser.add_argument('--output-dir', type=str, default='results',
+                                  help='Directory to save results')
     
     # Visualize command
-    viz_parser = subparsers.add_parser('visualize', help='Generate visualizations')
-    viz_parser.add_argument('--output-dir', type=str, default='results',
-                          help='Directory to save visualizations')
+    if wanted('visualize'):
+        viz_parser = subparsers.add_parser('visualize', help='Generate visualizations')
+        viz_parser.add_argument('--output-dir', type=str, default='results',
+                              help='Directory to save visualizations')
     
-    # Parse arguments
-    args = parser.parse_args()
+    return parser
+
+
+def _cmd_summary(analyzer, args):
+    """Print the analysis summary"""
+    analyzer.print_summary()
+
+
+def _cmd_top(analyzer, args):
+    """Print the highest scoring deals"""
+    top_deals = analyzer.get_top_deals(args.count)
+    print(f"\nTop {args.count} Deals:")
+    print_table(top_deals)
+
+
+def _cmd_category(analyzer, args):
+    """Print deals whose category matches the query, or the known categories"""
+    category_deals = analyzer.search_deals_by_category(args.category)
+    if len(category_deals) == 0:
+        print(f"No items found in category: {args.category}")
+        print("Available categories:")
+        for cat in analyzer.get_categories():
+            print(f"- {cat}")
+    else:
+        print(f"\nDeals in category '{args.category}':")
+        print_table(category_deals)
+
+
+def _cmd_rating(analyzer, args):
+    """Print deals with the given rating"""
+    rating_deals = analyzer.get_deals_by_rating(args.rating)
+    print(f"\nItems rated as '{args.rating}':")
+    print_table(rating_deals)
+
+
+def _cmd_item(analyzer, args):
+    """Print the details of one item and the best deals in its category"""
+    import numpy as np
+    import pandas as pd
     
-    # Create analyzer
-    analyzer = DuckDBAnalyzer(args.data_file)
-    analyzer.parse_data()
-    analyzer.fetch_market_prices()
-    analyzer.calculate_deals()  # Make sure to calculate deals before accessing deal_analysis
+    item_details = analyzer.con.execute("""
+        SELECT 
+            description,
+            category,
+            retail_price,
+            starting_bid,
+            market_price,
+            median_price,
+            min_price,
+            max_price,
+            listing_count,
+            top_condition,
+            source_type,
+            optimal_price,
+            deal_score,
+            deal_rating,
+            data_confidence,
+            market_volatility,
+            retail_market_gap
+        FROM deal_analysis 
+        WHERE item_number = ?
+    """, [args.item_number]).fetchdf()
     
-    # Handle commands
-    if args.command == 'summary':
-        analyzer.print_summary()
-    
-    elif args.command == 'top':
-        top_deals = analyzer.get_top_deals(args.count)
-        print(f"\nTop {args.count} Deals:")
-        print_table(top_deals)
-    
-    elif args.command == 'category':
-        category_deals = analyzer.get_deals_by_category(args.category)
-        if len(category_deals) == 0:
-            print(f"No items found in category: {args.category}")
-            print("Available categories:")
-            categories = analyzer.con.execute("SELECT DISTINCT category FROM items").fetchall()
-            for cat in categories:
-                print(f"- {cat[0]}")
-        else:
-            print(f"\nDeals in category '{args.category}':")
-            print_table(category_deals)
-    
-    elif args.command == 'rating':
-        rating_deals = analyzer.get_deals_by_rating(args.rating)
-        print(f"\nItems rated as '{args.rating}':")
-        print_table(rating_deals)
-    
-    elif args.command == 'item':
-        item_details = analyzer.con.execute(f"""
-            SELECT * FROM deal_analysis WHERE item_number = {args.item_number}
-        """).fetchdf()
+    if len(item_details) == 0:
+        print(f"No item found with item number: {args.item_number}")
+    else:
+        print(f"\nDetails for Item #{args.item_number}:")
+        # Fill missing display values once on the row (an all-NULL column may come back numeric)
+        item = item_details.iloc[0].fillna(ITEM_DEFAULTS)
         
-        if len(item_details) == 0:
-            print(f"No item found with item number: {args.item_number}")
-        else:
-            print(f"\nDetails for Item #{args.item_number}:")
-            item = item_details.iloc[0]
-            print(f"Description: {item['description']}")
-            print(f"Category: {item['category']}")
-            
-            # Price Information
-            print("\nPrice Information:")
-            retail_price = f"${item['retail_price']:.2f}" if not pd.isna(item['retail_price']) else "$0.00"
-            starting_bid = f"${item['starting_bid']:.2f}" if not pd.isna(item['starting_bid']) else "$0.00"
-            print(f"Retail Price: {retail_price}")
-            print(f"Starting Bid: {starting_bid}")
-            
-            # Market Data from Reverb
-            print("\nMarket Data (Reverb):")
-            market_price = f"${item['market_price']:.2f}" if not pd.isna(item['market_price']) else "$0.00"
-            median_price = f"${item['median_price']:.2f}" if not pd.isna(item['median_price']) else "$0.00"
-            min_price = f"${item['min_price']:.2f}" if not pd.isna(item['min_price']) else "$0.00"
-            max_price = f"${item['max_price']:.2f}" if not pd.isna(item['max_price']) else "$0.00"
-            print(f"Average Market Price: {market_price}")
-            print(f"Median Price: {median_price}")
-            print(f"Price Range: {min_price} - {max_price}")
-            print(f"Number of Listings: {item['listing_count']}")
-            print(f"Most Common Condition: {item['top_condition'] if not pd.isna(item['top_condition']) else 'Unknown'}")
-            print(f"Data Source: {item['source_type']}")
-            
-            # Analysis
-            print("\nDeal Analysis:")
-            optimal_price = f"${item['optimal_price']:.2f}" if not pd.isna(item['optimal_price']) else "$0.00"
-            deal_score = f"{item['deal_score']:.1f}%" if not pd.isna(item['deal_score']) else "0.0%"
-            data_confidence = f"{item['data_confidence']}%" if not pd.isna(item['data_confidence']) else "0%"
-            
-            print(f"Optimal Price: {optimal_price}")
-            print(f"Deal Score: {deal_score}")
-            print(f"Deal Rating: {item['deal_rating']}")
-            print(f"Data Confidence: {data_confidence}")
-            print(f"Market Volatility: {item['market_volatility']}")
+        # Format every dollar field in one vectorized pass
+        money_values = item[MONEY_COLUMNS].to_numpy(dtype='float64')
+        money = dict(zip(MONEY_COLUMNS, np.char.mod('$%.2f', money_values)))
+        
+        print(f"Description: {item['description']}")
+        print(f"Category: {item['category']}")
+        
+        # Price Information
+        print("\nPrice Information:")
+        print(f"Retail Price: {money['retail_price']}")
+        print(f"Starting Bid: {money['starting_bid']}")
+        
+        # Market Data from Reverb
+        print("\nMarket Data (Reverb):")
+        print(f"Average Market Price: {money['market_price']}")
+        print(f"Median Price: {money['median_price']}")
+        print(f"Price Range: {money['min_price']} - {money['max_price']}")
+        print(f"Number of Listings: {item['listing_count']}")
+        print(f"Most Common Condition: {item['top_condition']}")
+        print(f"Data Source: {item['source_type']}")
+        
+        # Analysis
+        print("\nDeal Analysis:")
+        print(f"Optimal Price: {money['optimal_price']}")
+        print(f"Deal Score: {item['deal_score']:.1f}%")
+        print(f"Deal Rating: {item['deal_rating']}")
+        print(f"Data Confidence: {item['data_confidence']}%")
+        print(f"Market Volatility: {item['market_volatility']}")
+        
+        # Market vs Retail
+        if not pd.isna(item['retail_market_gap']):
+            gap_value = abs(item['retail_market_gap'])
+            gap_str = f"{gap_value:.1f}%"
             
-            # Market vs Retail
-            if not pd.isna(item['retail_market_gap']):
-                gap_value = abs(item['retail_market_gap'])
-                gap_str = f"{gap_value:.1f}%"
-                
-                if item['retail_market_gap'] > 0:
-                    print(f"\nRetail price is {gap_str} above market value")
-                elif item['retail_market_gap'] < 0:
-                    print(f"\nRetail price is {gap_str} below market value")
-                else:
-                    print("\nRetail price matches market value")
+            if item['retail_market_gap'] > 0:
+                print(f"\nRetail price is {gap_str} above market value")
+            elif item['retail_market_gap'] < 0:
+                print(f"\nRetail price is {gap_str} below market value")
             else:
-                print("\nInsufficient data to compare retail and market prices")
-            
-            # Show similar items with enhanced market data
-            print("\nSimilar items in same category:")
-            similar = analyzer.con.execute(f"""
-                SELECT 
-                    item_number, 
-                    description, 
-                    starting_bid,
-                    market_price,
-                    median_price,
-                    listing_count,
-                    deal_score,
-                    deal_rating,
-                    data_confidence
-                FROM deal_analysis 
-                WHERE 
-                    category = '{item['category']}' AND 
-                    item_number != {args.item_number}
-                ORDER BY deal_score DESC
-                LIMIT 5
-            """).fetchdf()
-            print_table(similar)
-    
-    elif args.command == 'export':
-        analyzer.export_results(args.output_dir)
-        print(f"Results exported to {args.output_dir}/")
-    
-    elif args.command == 'visualize':
-        analyzer.create_visualizations(args.output_dir)
-        print(f"Visualizations saved to {args.output_dir}/")
+                print("\nRetail price matches market value")
+        else:
+            print("\nInsufficient data to compare retail and market prices")
+        
+        # Show similar items with enhanced market data
+        print("\nSimilar items in same category:")
+        similar = analyzer.con.execute("""
+            SELECT 
+                item_number, 
+                description, 
+                starting_bid,
+                market_price,
+                median_price,
+                listing_count,
+                deal_score,
+                deal_rating,
+                data_confidence
+            FROM deal_analysis 
+            WHERE 
+                category = ? AND 
+                item_number != ?
+            ORDER BY deal_score DESC
+            LIMIT 5
+        """, [item['category'], args.item_number]).fetchdf()
+        print_table(similar)
+
+
+def _cmd_export(analyzer, args):
+    """Export the analysis to CSV files"""
+    analyzer.export_results(args.output_dir)
+    print(f"Results exported to {args.output_dir}/")
+
+
+def _cmd_visualize(analyzer, args):
+    """Save the analysis charts"""
+    analyzer.create_visualizations(args.output_dir)
+    print(f"Visualizations saved to {args.output_dir}/")
+
+
+# Handler for each subcommand, called as handler(analyzer, args)
+HANDLERS = {
+    'summary': _cmd_summary,
+    'top': _cmd_top,
+    'category': _cmd_category,
+    'rating': _cmd_rating,
+    'item': _cmd_item,
+    'export': _cmd_export,
+    'visualize': _cmd_visualize,
+}
+
+
+def main():
+    # Only the subparser for the requested command is built
+    parser = _build_parser(_find_command(sys.argv[1:]))
     
-    else:
-        # If no command specified, show help
+    # Parse arguments
+    args = parser.parse_args()
+    
+    # Import the analyzer (pandas, DuckDB) only once a command needs it
+    if args.command is None:
         parser.print_help()
+        return
+    import duckdb
+    from duckdb_analyzer import DuckDBAnalyzer
+    
+    # Reuse the analysis saved by an earlier run on the same version of the data file
+    cache_file = _analysis_cache_file(args.data_file)
+    if os.path.exists(cache_file) and (args.refresh or not _cache_is_fresh(cache_file)):
+        os.remove(cache_file)
+    os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+    if not os.path.exists(cache_file):
+        # Analyses of earlier versions of the data file are never read again
+        _prune_analysis_cache(args.data_file, keep=cache_file)
+    
+    # Create analyzer
+    try:
+        analyzer = DuckDBAnalyzer(args.data_file, database=cache_file)
+    except duckdb.IOException:
+        # Another run holds the cache file open; analyze in memory instead
+        analyzer = DuckDBAnalyzer(args.data_file)
+    if not analyzer.has_analysis():
+        analyzer.parse_data()
+        analyzer.fetch_market_prices()
+        analyzer.calculate_deals()  # Make sure to calculate deals before accessing deal_analysis
+    
+    # Handle commands
+    HANDLERS[args.command](analyzer, args)
 
 
 if __name__ == '__main__':
@@ -4,114 +4,218 @@ DuckDB Auction Analyzer - Uses DuckDB for efficient analysis of auction data
 """
 import pandas as pd
 import duckdb
+import glob
 import os
-import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from tabulate import tabulate
+import shutil
+import tempfile
 from typing import Dict, List, Tuple, Optional
 from market_scraper import MarketScraper
+from urllib.parse import unquote
 import re
 
+# Item line: number, description, then optional retail and starting bid prices
+_ITEM_RE = re.compile(
+    r"^(\d+)\s+(.*?)(?:\s+Retail\s+\$([0-9,]+))?(?:\s+Starting\s+Bid\s+\$([0-9,]+))?$"
+)
+
+# The 5 best and 5 worst deals printed by print_summary
+_DEALS_SUMMARY_SQL = """
+    SELECT
+        item_number,
+        description,
+        deal_rating,
+        deal_score,
+        starting_bid,
+        ROUND(optimal_price) AS optimal_price,
+        retail_price
+    FROM deal_analysis
+    ORDER BY deal_score {}
+    LIMIT 5
+"""
+_BEST_DEALS_SQL = _DEALS_SUMMARY_SQL.format("DESC")
+_WORST_DEALS_SQL = _DEALS_SUMMARY_SQL.format("ASC")
+
+
+def _sql_literal(text: str) -> str:
+    """Quote text as a SQL string literal (COPY only accepts a bound path on DuckDB 1.4+)"""
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _or_na(value) -> str:
+    """Render a summary value, showing a missing one as N/A"""
+    return "N/A" if value is None else str(value)
+
+
+def _dollars(value) -> str:
+    """Render a summary price, showing a missing one as N/A"""
+    return "N/A" if value is None else f"${value}"
+
+
+def _is_price(text: str) -> bool:
+    """Check that text is what _ITEM_RE accepts as a price ([0-9,]+)"""
+    return bool(text) and not text.strip("0123456789,")
+
+
+def _split_item_line(line: str) -> Optional[Tuple[str, str, Optional[str], Optional[str]]]:
+    """Split an item line into the same groups as _ITEM_RE without running the regex
+
+    Handles the regular single-spaced layout with plain string splits and falls back
+    to _ITEM_RE for anything else, so results always match _ITEM_RE.match(line).
+    """
+    head, tag, starting_bid = line.rpartition(" Starting Bid $")
+    if not tag:
+        head, starting_bid = line, None
+    elif not _is_price(starting_bid):
+        head = None
+    if head is not None:
+        rest, tag, retail = head.rpartition(" Retail $")
+        if not tag:
+            rest, retail = head, None
+        elif not _is_price(retail):
+            rest = None
+    else:
+        rest = None
+
+    if rest is not None:
+        item_num, sep, description = rest.partition(" ")
+        # Irregular spacing, or a price label the splits missed, needs the regex
+        if (
+            sep
+            and item_num.isdecimal()
+            and description
+            and not description[0].isspace()
+            and not description[-1].isspace()
+            and (retail is not None or "Retail" not in description)
+            and (starting_bid is not None or "Starting" not in description)
+        ):
+            return item_num, description, retail, starting_bid
+
+    match = _ITEM_RE.match(line)
+    return match.groups() if match else None
+
+
+# Categories assigned by parse_data; the items table stores category as an ENUM of these
+CATEGORIES = [
+    "Acoustic Guitar",
+    "Bass Guitar",
+    "Electric Guitar",
+    "Amplifier",
+    "Effect Pedal",
+    "Ukulele",
+    "Banjo",
+    "Mandolin",
+    "Other",
+]
+
 
 class DuckDBAnalyzer:
-    def __init__(self, data_file: str):
-        """Initialize the analyzer with data file path"""
+    def __init__(self, data_file: str, database: str = ":memory:"):
+        """Initialize the analyzer with data file path and DuckDB database (in memory by default)"""
         self.data_file = data_file
-        self.con = duckdb.connect(":memory:")
+        self.con = duckdb.connect(database)
         self.market_scraper = MarketScraper()
         self.tables_created = False
+        self.deals_built = False
+        self._categories = None
+
+    def has_analysis(self) -> bool:
+        """Check whether the database already holds a finished analysis (e.g. from a file cache)"""
+        # deal_analysis is created last, so its presence means parse and fetch both completed
+        found = self.con.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'deal_analysis'"
+        ).fetchone()[0]
+        if found:
+            self.tables_created = True
+            self.deals_built = True
+        return bool(found)
 
     def parse_data(self) -> None:
         """Parse auction data and load into DuckDB"""
-        items = []
-
-        with open(self.data_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line == "INTERMISSION":
-                    continue
-
-                # Extract item number and description
-                match = re.match(
-                    r"^(\d+)\s+(.*?)(?:\s+Retail\s+\$([0-9,]+))?(?:\s+Starting\s+Bid\s+\$([0-9,]+))?$",
-                    line,
-                )
-                if match:
-                    item_num, description, retail, starting_bid = match.groups()
-
-                    # Clean the values
-                    retail = int(retail.replace(",", "")) if retail else None
-                    starting_bid = (
-                        int(starting_bid.replace(",", "")) if starting_bid else None
-                    )
-
-                    items.append(
-                        {
-                            "item_number": int(item_num),
-                            "description": description,
-                            "retail_price": retail,
-                            "starting_bid": starting_bid,
-                            "category": self._categorize_item(description),
-                        }
-                    )
+        item_numbers, descriptions, retail_prices, starting_bids = [], [], [], []
+
+        with open(self.data_file, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+        # Only split lines here; casting and categorizing run once per column in DuckDB
+        for line in lines:
+            line = line.strip()
+            if not line or line == "INTERMISSION":
+                continue
+
+            # Extract item number and description
+            groups = _split_item_line(line)
+            if groups:
+                item_numbers.append(int(groups[0]))
+                descriptions.append(groups[1])
+                retail_prices.append(groups[2])
+                starting_bids.append(groups[3])
+
+        raw_items = pd.DataFrame(
+            {
+                "item_number": pd.Series(item_numbers, dtype="int64"),
+                "description": pd.Series(descriptions, dtype=object),
+                "retail": pd.Series(retail_prices, dtype=object),
+                "starting_bid": pd.Series(starting_bids, dtype=object),
+            }
+        )
+        category_type = "ENUM({})".format(", ".join(f"'{c}'" for c in CATEGORIES))
 
-        # Create DuckDB table from items
-        df = pd.DataFrame(items)
-        self.con.execute("CREATE TABLE IF NOT EXISTS items AS SELECT * FROM df")
+        # Create DuckDB table from items, storing category as an ENUM of CATEGORIES
+        self.con.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS items AS
+            SELECT
+                item_number,
+                description,
+                CAST(NULLIF(replace(retail, ',', ''), '') AS BIGINT) AS retail_price,
+                CAST(NULLIF(replace(starting_bid, ',', ''), '') AS BIGINT) AS starting_bid,
+                CAST(
+                    CASE
+                        WHEN regexp_matches(description_lower, 'guitar|stratocaster|les paul|telecaster') THEN
+                            CASE
+                                WHEN contains(description_lower, 'acoustic') THEN 'Acoustic Guitar'
+                                WHEN contains(description_lower, 'bass') THEN 'Bass Guitar'
+                                ELSE 'Electric Guitar'
+                            END
+                        WHEN contains(description_lower, 'amp') THEN 'Amplifier'
+                        WHEN regexp_matches(description_lower, 'pedal|effect|delay|reverb|overdrive') THEN 'Effect Pedal'
+                        WHEN contains(description_lower, 'ukulele') THEN 'Ukulele'
+                        WHEN contains(description_lower, 'banjo') THEN 'Banjo'
+                        WHEN contains(description_lower, 'mandolin') THEN 'Mandolin'
+                        ELSE 'Other'
+                    END AS {category_type}
+                ) AS category
+            FROM (SELECT *, lower(description) AS description_lower FROM raw_items)
+        """
+        )
         self.tables_created = True
+        self._categories = None
 
-    def _categorize_item(self, description: str) -> str:
-        """Categorize item based on description"""
-        description_lower = description.lower()
-
-        if any(
-            word in description_lower
-            for word in ["guitar", "stratocaster", "les paul", "telecaster"]
-        ):
-            if "acoustic" in description_lower:
-                return "Acoustic Guitar"
-            elif "bass" in description_lower:
-                return "Bass Guitar"
-            else:
-                return "Electric Guitar"
-        elif any(word in description_lower for word in ["amp", "amplifier"]):
-            return "Amplifier"
-        elif any(
-            word in description_lower
-            for word in ["pedal", "effect", "delay", "reverb", "overdrive"]
-        ):
-            return "Effect Pedal"
-        elif any(word in description_lower for word in ["ukulele"]):
-            return "Ukulele"
-        elif any(word in description_lower for word in ["banjo"]):
-            return "Banjo"
-        elif any(word in description_lower for word in ["mandolin"]):
-            return "Mandolin"
-        else:
-            return "Other"
-
-    def fetch_market_prices(self) -> None:
+    def fetch_market_prices(self, max_workers: int = 16) -> None:
         """Fetch market prices for all items and update DuckDB table"""
         if not self.tables_created:
             self.parse_data()
 
-        # Get all items from DuckDB
-        items_df = self.con.execute(
+        # Get all items from DuckDB; they are only iterated, so fetch plain tuples
+        items = self.con.execute(
             "SELECT item_number, description FROM items"
-        ).fetchdf()
+        ).fetchall()
 
         # Fetch market prices
         print("Fetching market prices for all items... This might take a while")
         market_data = []
+        # Per-item progress lines, written out in one go after the loop
+        log_lines = []
+
+        # Get market prices from scraper with our new Reverb API integration; lots
+        # with the same normalized description share one concurrent lookup
+        cache_keys = [self.market_scraper.cache_key(d) for _, d in items]
+        fetched = self.market_scraper.get_market_prices(
+            [d for _, d in items], max_workers=max_workers
+        )
 
-        for _, row in items_df.iterrows():
-            item_num = row["item_number"]
-            description = row["description"]
-
-            # Get market prices from scraper with our new Reverb API integration
-            price_data = self.market_scraper.get_market_price(description)
-
+        for (item_num, _), cache_key in zip(items, cache_keys):
+            price_data = fetched[cache_key]
             # Extract the data we need from the API response
             if price_data and isinstance(price_data, dict):
                 # Default values
@@ -122,8 +226,7 @@ class DuckDBAnalyzer:
                 min_price = None
                 max_price = None
                 median_price = None
-                top_condition = None
-                condition_breakdown = "{}"
+                conditions = {}
 
                 # Extract values based on source type
                 if source_type == "reverb_api":
@@ -133,13 +236,8 @@ class DuckDBAnalyzer:
                     max_price = price_data.get("max_price")
                     median_price = price_data.get("median_price")
 
-                    # Get condition information
+                    # Get condition information; the top condition is picked in SQL
                     conditions = price_data.get("conditions", {})
-                    condition_breakdown = json.dumps(conditions)
-
-                    # Find the top condition (most common)
-                    if conditions:
-                        top_condition = max(conditions.items(), key=lambda x: x[1])[0]
                 else:
                     # Fallback to simulated data format
                     reverb_price = price_data.get("average_price")
@@ -154,14 +252,14 @@ class DuckDBAnalyzer:
                         "max_price": max_price,
                         "median_price": median_price,
                         "count": count,
-                        "top_condition": top_condition,
-                        "condition_breakdown": condition_breakdown,
+                        "condition_names": list(conditions),
+                        "condition_counts": list(conditions.values()),
                         "source_type": source_type,
                     }
                 )
 
                 avg_price_str = f"${market_price:.2f}" if market_price is not None else "$0.00"
-                print(
+                log_lines.append(
                     f"Fetched prices for item #{item_num} - Found {count} listings, Avg: {avg_price_str}"
                 )
             else:
@@ -175,22 +273,37 @@ class DuckDBAnalyzer:
                         "max_price": None,
                         "median_price": None,
                         "count": 0,
-                        "top_condition": None,
-                        "condition_breakdown": "{}",
+                        "condition_names": [],
+                        "condition_counts": [],
                         "source_type": "no_data",
                     }
                 )
-                print(f"No price data found for item #{item_num}")
+                log_lines.append(f"No price data found for item #{item_num}")
+
+        if log_lines:
+            print("\n".join(log_lines))
 
         # Create market prices table in DuckDB
         market_df = pd.DataFrame(market_data)
         self.con.execute("DROP TABLE IF EXISTS market_prices")
-        self.con.execute("CREATE TABLE market_prices AS SELECT * FROM market_df")
+        self.con.execute(
+            """
+            CREATE TABLE market_prices AS
+            SELECT
+                * EXCLUDE (condition_names, condition_counts),
+                -- Listing count per condition, in the order the API returned them
+                MAP(
+                    CAST(condition_names AS VARCHAR[]),
+                    CAST(condition_counts AS INTEGER[])
+                ) AS conditions
+            FROM market_df
+        """
+        )
 
         # Join tables
         self.con.execute(
             """
-            CREATE OR REPLACE VIEW item_analysis AS
+            CREATE OR REPLACE TABLE item_analysis AS
             SELECT 
                 i.item_number,
                 i.description,
@@ -203,7 +316,10 @@ class DuckDBAnalyzer:
                 m.min_price,
                 m.max_price,
                 m.count AS listing_count,
-                m.top_condition,
+                -- Most common condition (the first one listed on a tie)
+                map_keys(m.conditions)[
+                    list_position(map_values(m.conditions), list_max(map_values(m.conditions)))
+                ] AS top_condition,
                 m.source_type,
                 -- Calculate optimal price using real market data with more weight when we have more listings
                 CASE 
@@ -240,21 +356,26 @@ class DuckDBAnalyzer:
             JOIN market_prices m ON i.item_number = m.item_number
         """
         )
+        self.deals_built = False
 
-    def calculate_deals(self) -> None:
+    def calculate_deals(self, force: bool = False) -> None:
         """Calculate deal scores and categories based on real market data"""
+        # The accessors all call this; only the first call (or a forced one) rebuilds the table
+        if self.deals_built and not force:
+            return
         if not self.tables_created:
             self.parse_data()
 
-        # Calculate deal score and categorize with enhanced logic for real market data
+        # Calculate deal score and categorize with enhanced logic for real market data;
+        # stored as a table so the summary, export and lookup queries just scan it
         self.con.execute(
             """
-            CREATE OR REPLACE VIEW deal_analysis AS
+            CREATE OR REPLACE TABLE deal_analysis AS
             SELECT 
-                *,
+                * EXCLUDE (discount_pct),
                 -- Basic deal score calculation
                 CASE
-                    WHEN optimal_price > 0 THEN ROUND(((optimal_price - starting_bid) / optimal_price) * 100, 1)
+                    WHEN optimal_price > 0 THEN ROUND(discount_pct, 1)
                     ELSE 0
                 END AS deal_score,
                 
@@ -280,11 +401,11 @@ class DuckDBAnalyzer:
                     -- First handle overpriced items
                     WHEN optimal_price <= starting_bid THEN 'Overpriced'
                     -- Consider low starting bid relative to optimal price, with confidence factor
-                    WHEN ((optimal_price - starting_bid) / optimal_price) * 100 >= 60 AND listing_count >= 5 THEN 'Exceptional Deal'
-                    WHEN ((optimal_price - starting_bid) / optimal_price) * 100 >= 50 THEN 'Great Deal'
-                    WHEN ((optimal_price - starting_bid) / optimal_price) * 100 >= 30 THEN 'Good Deal'
-                    WHEN ((optimal_price - starting_bid) / optimal_price) * 100 >= 15 THEN 'Fair Deal'
-                    WHEN ((optimal_price - starting_bid) / optimal_price) * 100 >= 0 THEN 'Slight Deal'
+                    WHEN discount_pct >= 60 AND listing_count >= 5 THEN 'Exceptional Deal'
+                    WHEN discount_pct >= 50 THEN 'Great Deal'
+                    WHEN discount_pct >= 30 THEN 'Good Deal'
+                    WHEN discount_pct >= 15 THEN 'Fair Deal'
+                    WHEN discount_pct >= 0 THEN 'Slight Deal'
                     ELSE 'Not a Deal'
                 END AS deal_rating,
                 
@@ -300,16 +421,23 @@ class DuckDBAnalyzer:
                         ROUND(((retail_price - market_price) / retail_price) * 100, 1)
                     ELSE NULL
                 END AS retail_market_gap
-            FROM item_analysis
+            FROM (
+                -- Discount of the starting bid from the optimal price, computed once per row
+                SELECT *, ((optimal_price - starting_bid) / optimal_price) * 100 AS discount_pct
+                FROM item_analysis
+            )
             ORDER BY deal_score DESC
         """
         )
+        self.con.execute("ANALYZE deal_analysis")
+        self.deals_built = True
 
     def get_top_deals(self, n: int = 10) -> pd.DataFrame:
         """Get top N deals with enhanced market data"""
         self.calculate_deals()
+        # Bound with a parameter so DuckDB runs a top-k over deal_score instead of a full sort
         return self.con.execute(
-            f"""
+            """
             SELECT 
                 item_number,
                 description, 
@@ -327,15 +455,16 @@ class DuckDBAnalyzer:
                 retail_market_gap
             FROM deal_analysis
             ORDER BY deal_score DESC
-            LIMIT {n}
-        """
+            LIMIT ?
+        """,
+            [n],
         ).fetchdf()
 
     def get_deals_by_rating(self, rating: str) -> pd.DataFrame:
         """Get deals by rating category with enhanced market data"""
         self.calculate_deals()
         return self.con.execute(
-            f"""
+            """
             SELECT 
                 item_number,
                 description, 
@@ -352,16 +481,17 @@ class DuckDBAnalyzer:
                 deal_rating,
                 retail_market_gap
             FROM deal_analysis
-            WHERE deal_rating = '{rating}'
+            WHERE deal_rating = ?
             ORDER BY deal_score DESC
-        """
+        """,
+            [rating],
         ).fetchdf()
 
     def get_deals_by_category(self, category: str) -> pd.DataFrame:
         """Get deals for a specific category with enhanced market data"""
         self.calculate_deals()
         return self.con.execute(
-            f"""
+            """
             SELECT 
                 item_number,
                 description, 
@@ -378,49 +508,128 @@ class DuckDBAnalyzer:
                 deal_rating,
                 retail_market_gap
             FROM deal_analysis
-            WHERE category = '{category}'
+            WHERE category = ?
             ORDER BY deal_score DESC
-        """
+        """,
+            [category],
         ).fetchdf()
 
-    def export_results(self, output_dir: str = "results") -> None:
-        """Export results to CSV files"""
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Export main analysis
-        deals_df = self.con.execute(
+    def get_categories(self) -> List[str]:
+        """Get the distinct item categories, scanning the items table only once"""
+        if self._categories is None:
+            self._categories = [
+                category
+                for (category,) in self.con.execute(
+                    "SELECT DISTINCT category FROM items"
+                ).fetchall()
+            ]
+        return self._categories
+
+    def search_deals_by_category(self, query: str) -> pd.DataFrame:
+        """Get deals whose category contains query, ignoring case"""
+        self.calculate_deals()
+        # Match against the handful of category names, then filter rows by exact name
+        query = query.lower()
+        matches = [c for c in self.get_categories() if query in c.lower()]
+        return self.con.execute(
             """
-            SELECT * FROM deal_analysis
-        """
+            SELECT 
+                item_number,
+                description, 
+                category,
+                retail_price, 
+                starting_bid,
+                ROUND(market_price) AS market_price,
+                ROUND(median_price) AS median_price,
+                listing_count,
+                data_confidence,
+                market_volatility,
+                ROUND(optimal_price) AS optimal_price,
+                deal_score,
+                deal_rating,
+                retail_market_gap
+            FROM deal_analysis
+            WHERE list_contains(?, category)
+            ORDER BY deal_score DESC
+        """,
+            [matches],
         ).fetchdf()
 
-        deals_df.to_csv(os.path.join(output_dir, "auction_analysis.csv"), index=False)
+    def export_results(self, output_dir: str = "results") -> None:
+        """Export results to CSV files"""
+        os.makedirs(output_dir, exist_ok=True)
 
-        # Export by category
-        categories = self.con.execute(
-            """
-            SELECT DISTINCT category FROM items
-        """
-        ).fetchall()
+        # Export main analysis; COPY streams rows to disk without building a DataFrame
+        self.con.execute(
+            "COPY deal_analysis TO {} (FORMAT CSV, HEADER)".format(
+                _sql_literal(os.path.join(output_dir, "auction_analysis.csv"))
+            )
+        )
 
-        for (category,) in categories:
-            cat_df = self.get_deals_by_category(category)
-            cat_df.to_csv(
-                os.path.join(
-                    output_dir, f"{category.lower().replace(' ', '_')}_deals.csv"
-                ),
-                index=False,
+        # Export by category; one partitioned COPY writes every category's file in a
+        # single pass, which are then moved out of their category=<name> directories
+        partition_dir = tempfile.mkdtemp(dir=output_dir)
+        try:
+            self.con.execute(
+                """
+                COPY (
+                    SELECT
+                        item_number,
+                        description,
+                        category,
+                        retail_price,
+                        starting_bid,
+                        ROUND(market_price) AS market_price,
+                        ROUND(median_price) AS median_price,
+                        listing_count,
+                        data_confidence,
+                        market_volatility,
+                        ROUND(optimal_price) AS optimal_price,
+                        deal_score,
+                        deal_rating,
+                        retail_market_gap
+                    FROM deal_analysis
+                    ORDER BY deal_score DESC
+                ) TO {} (FORMAT CSV, HEADER, PARTITION_BY (category), WRITE_PARTITION_COLUMNS true)
+            """.format(_sql_literal(partition_dir))
             )
+            for name in os.listdir(partition_dir):
+                category = unquote(name.partition("=")[2])
+                # Each category must come out as a single file, whatever DuckDB names it
+                files = glob.glob(os.path.join(glob.escape(os.path.join(partition_dir, name)), "*"))
+                if len(files) != 1:
+                    raise RuntimeError(
+                        f"Expected one CSV file for category {category!r}, found {len(files)}"
+                    )
+                os.replace(
+                    files[0],
+                    os.path.join(
+                        output_dir, f"{category.lower().replace(' ', '_')}_deals.csv"
+                    ),
+                )
+        finally:
+            shutil.rmtree(partition_dir)
 
         print(f"Results exported to {output_dir}/ directory")
 
     def create_visualizations(self, output_dir: str = "results") -> None:
         """Create visualizations of the auction data"""
+        # Plotting libraries are slow to import, so only load them when charts are drawn;
+        # the charts are only saved to files, so draw on a Figure with its own Agg canvas
+        # rather than through pyplot, leaving the caller's backend alone
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        import seaborn as sns
+
         os.makedirs(output_dir, exist_ok=True)
 
         # Set style
         sns.set_style("whitegrid")
-        plt.rcParams["figure.figsize"] = (10, 6)
+
+        # One figure is reused for every chart: cleared and resized between plots
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
 
         # 1. Deal distribution by rating
         deal_counts = self.con.execute(
@@ -436,35 +645,85 @@ class DuckDBAnalyzer:
                     ELSE 4
                 END
         """
-        ).fetchdf()
+        ).fetchall()
 
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x="deal_rating", y="count", data=deal_counts, palette="viridis")
-        plt.title("Distribution of Deals by Rating")
-        plt.xlabel("Deal Rating")
-        plt.ylabel("Count")
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, "deal_distribution.png"), dpi=300)
+        # A handful of (rating, count) pairs: pass them as plain lists, no DataFrame needed
+        ratings, counts = zip(*deal_counts)
+        sns.barplot(x=list(ratings), y=list(counts), palette="viridis", ax=ax)
+        ax.set_title("Distribution of Deals by Rating")
+        ax.set_xlabel("Deal Rating")
+        ax.set_ylabel("Count")
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, "deal_distribution.png"), dpi=150)
 
         # 2. Deal score distribution by category
-        plt.figure(figsize=(12, 8))
-        category_deals = self.con.execute(
+        fig.clf()
+        fig.set_size_inches(12, 8)
+        ax = fig.add_subplot()
+        # The box statistics (quartiles, 1.5 IQR whiskers and outliers, as seaborn draws
+        # them) are computed in DuckDB, so only one row per category comes back
+        category_stats = self.con.execute(
             """
-            SELECT category, deal_score
-            FROM deal_analysis
+            WITH quartiles AS (
+                SELECT
+                    category,
+                    quantile_cont(deal_score, [0.25, 0.5, 0.75]) AS q,
+                    1.5 * (q[3] - q[1]) AS reach
+                FROM deal_analysis
+                GROUP BY category
+            )
+            SELECT
+                d.category,
+                any_value(q.q[1]) AS q1,
+                any_value(q.q[2]) AS med,
+                any_value(q.q[3]) AS q3,
+                MIN(d.deal_score) FILTER (WHERE d.deal_score >= q.q[1] - q.reach) AS whislo,
+                MAX(d.deal_score) FILTER (WHERE d.deal_score <= q.q[3] + q.reach) AS whishi,
+                list(d.deal_score) FILTER (
+                    WHERE d.deal_score < q.q[1] - q.reach OR d.deal_score > q.q[3] + q.reach
+                ) AS fliers
+            FROM deal_analysis d
+            JOIN quartiles q ON d.category = q.category
+            GROUP BY d.category
+            ORDER BY d.category
         """
-        ).fetchdf()
+        ).fetchall()
 
-        sns.boxplot(x="category", y="deal_score", data=category_deals, palette="Set3")
-        plt.title("Deal Score Distribution by Category")
-        plt.xlabel("Category")
-        plt.ylabel("Deal Score (%)")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, "category_deal_scores.png"), dpi=300)
+        boxes = [
+            {
+                "label": str(category),
+                "q1": q1,
+                "med": med,
+                "q3": q3,
+                "whislo": whislo,
+                "whishi": whishi,
+                "fliers": fliers or [],
+            }
+            for category, q1, med, q3, whislo, whishi, fliers in category_stats
+        ]
+        colors = sns.color_palette("Set3", len(boxes), desat=0.75)
+        artists = ax.bxp(
+            boxes,
+            widths=0.8,
+            patch_artist=True,
+            medianprops={"color": "0.4"},
+            whiskerprops={"color": "0.4"},
+            capprops={"color": "0.4"},
+            flierprops={"marker": "o", "markeredgecolor": "0.4"},
+        )
+        for box, color in zip(artists["boxes"], colors):
+            box.set(facecolor=color, edgecolor="0.4")
+        ax.set_title("Deal Score Distribution by Category")
+        ax.set_xlabel("Category")
+        ax.set_ylabel("Deal Score (%)")
+        ax.tick_params(axis="x", labelrotation=45)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, "category_deal_scores.png"), dpi=150)
 
         # 3. Starting bid vs. optimal price scatter
-        plt.figure(figsize=(10, 8))
+        fig.clf()
+        fig.set_size_inches(10, 8)
+        ax = fig.add_subplot()
         price_data = self.con.execute(
             """
             SELECT 
@@ -476,6 +735,7 @@ class DuckDBAnalyzer:
         """
         ).fetchdf()
 
+        # Rasterize the markers so hundreds of points render as one image
         sns.scatterplot(
             x="starting_bid",
             y="optimal_price",
@@ -484,31 +744,40 @@ class DuckDBAnalyzer:
             s=100,
             alpha=0.7,
             data=price_data,
+            rasterized=True,
+            ax=ax,
         )
 
         # Add diagonal line representing equal prices
         max_val = max(
             price_data["starting_bid"].max(), price_data["optimal_price"].max()
         )
-        plt.plot([0, max_val], [0, max_val], "r--", alpha=0.3)
+        ax.plot([0, max_val], [0, max_val], "r--", alpha=0.3)
 
-        plt.title("Starting Bid vs. Optimal Price")
-        plt.xlabel("Starting Bid ($)")
-        plt.ylabel("Optimal Price ($)")
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, "bid_vs_optimal.png"), dpi=300)
+        ax.set_title("Starting Bid vs. Optimal Price")
+        ax.set_xlabel("Starting Bid ($)")
+        ax.set_ylabel("Optimal Price ($)")
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, "bid_vs_optimal.png"), dpi=150)
 
         print(f"Visualizations saved to {output_dir}/ directory")
 
     def print_summary(self) -> None:
         """Print summary of auction analysis"""
+        from tabulate import tabulate
+
         self.calculate_deals()
 
-        # Overall stats
-        stats = self.con.execute(
+        # Overall stats, deal breakdown and category breakdown from one scan: the
+        # grouping sets yield the grand total row, then a row per rating and per category
+        summary = self.con.execute(
             """
             SELECT 
-                COUNT(*) as total_items,
+                GROUPING(deal_rating, category) AS grouping_set,
+                deal_rating,
+                category,
+                COUNT(*) as count,
+                ROUND(COUNT(*) * 100.0 / MAX(COUNT(*)) OVER (), 1) as percentage,
                 ROUND(AVG(deal_score), 1) as avg_deal_score,
                 ROUND(MIN(deal_score), 1) as min_deal_score,
                 ROUND(MAX(deal_score), 1) as max_deal_score,
@@ -516,43 +785,24 @@ class DuckDBAnalyzer:
                 ROUND(SUM(starting_bid), 2) as total_starting_bids,
                 ROUND(SUM(optimal_price - starting_bid), 2) as total_potential_savings
             FROM deal_analysis
-        """
-        ).fetchone()
-
-        # Deal breakdown
-        deal_counts = self.con.execute(
-            """
-            SELECT 
-                deal_rating, 
-                COUNT(*) as count,
-                ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM deal_analysis), 1) as percentage
-            FROM deal_analysis 
-            GROUP BY deal_rating
+            GROUP BY GROUPING SETS ((), (deal_rating), (category))
             ORDER BY 
+                grouping_set DESC,
                 CASE 
                     WHEN deal_rating = 'Great Deal' THEN 1
                     WHEN deal_rating = 'Good Deal' THEN 2 
                     WHEN deal_rating = 'Fair Deal' THEN 3
                     ELSE 4
-                END
+                END,
+                avg_deal_score DESC
         """
-        ).fetchdf()
-
-        # Category breakdown
-        category_counts = self.con.execute(
-            """
-            SELECT 
-                category,
-                COUNT(*) as count,
-                ROUND(AVG(deal_score), 1) as avg_deal_score
-            FROM deal_analysis
-            GROUP BY category
-            ORDER BY avg_deal_score DESC
-        """
-        ).fetchdf()
+        ).fetchall()
 
-        # Top 5 deals
-        top_deals = self.get_top_deals(5)
+        # GROUPING() sets a bit for each rolled-up column: 3 = total, 1 = rating, 2 = category;
+        # the rows are only printed, so they stay tuples rather than becoming DataFrames
+        stats = next(row[3:4] + row[5:] for row in summary if row[0] == 3)
+        deal_counts = [row[1:2] + row[3:5] for row in summary if row[0] == 1]
+        category_counts = [(row[2], row[3], row[5]) for row in summary if row[0] == 2]
 
         # Print summary
         print("\n===== AUCTION ANALYSIS SUMMARY =====\n")
@@ -564,48 +814,49 @@ class DuckDBAnalyzer:
         print(f"Total potential savings: ${stats[6]:,.2f}")
 
         print("\nDeal breakdown:")
-        print(tabulate(deal_counts, headers="keys", tablefmt="pretty", showindex=False))
+        print(
+            tabulate(
+                deal_counts,
+                headers=["deal_rating", "count", "percentage"],
+                tablefmt="pretty",
+            )
+        )
 
         print("\nCategory analysis:")
         print(
             tabulate(
-                category_counts, headers="keys", tablefmt="pretty", showindex=False
+                category_counts,
+                headers=["category", "count", "avg_deal_score"],
+                tablefmt="pretty",
             )
         )
 
         print("\nTop 5 deals:")
-        for _, row in top_deals.iterrows():
-            print(
-                f"  #{row['item_number']}: {row['description']} - {row['deal_rating']} (Score: {row['deal_score']})"
-            )
-            print(
-                f"    Starting bid: ${row['starting_bid']} | Optimal price: ${row['optimal_price']} | Retail: ${row['retail_price']}"
-            )
-
-        # Worst 5 deals
-        worst_deals = self.con.execute(
-            """
-            SELECT 
-                item_number,
-                description, 
-                retail_price, 
-                starting_bid,
-                ROUND(optimal_price) AS optimal_price,
-                deal_score,
-                deal_rating
-            FROM deal_analysis
-            ORDER BY deal_score ASC
-            LIMIT 5
-        """
-        ).fetchdf()
+        self._print_deals(descending=True)
 
         print("\nWorst 5 deals:")
-        for _, row in worst_deals.iterrows():
+        self._print_deals(descending=False)
+
+    def _print_deals(self, descending: bool) -> None:
+        """Print a two-line summary for each of the 5 best (descending) or worst deals"""
+        deals = self.con.execute(
+            _BEST_DEALS_SQL if descending else _WORST_DEALS_SQL
+        ).fetchall()
+        for (
+            item_number,
+            description,
+            deal_rating,
+            deal_score,
+            starting_bid,
+            optimal_price,
+            retail_price,
+        ) in deals:
             print(
-                f"  #{row['item_number']}: {row['description']} - {row['deal_rating']} (Score: {row['deal_score']})"
+                f"  #{item_number}: {description} - {deal_rating} (Score: {_or_na(deal_score)})"
             )
             print(
-                f"    Starting bid: ${row['starting_bid']} | Optimal price: ${row['optimal_price']} | Retail: ${row['retail_price']}"
+                f"    Starting bid: {_dollars(starting_bid)} | Optimal price: {_dollars(optimal_price)}"
+                f" | Retail: {_dollars(retail_price)}"
             )
 
 
@@ -8,30 +8,71 @@ from typing import Dict, Optional, List, Tuple
 import time
 import os
 import json
+import functools
 import re
 import random
-from datetime import datetime, timedelta
-from urllib.parse import quote_plus
-import requests
+import sqlite3
+import statistics
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Reverb API and cache settings, read once per process
+REVERB_API_TOKEN = os.getenv("REVERB_API_TOKEN")
+USE_SANDBOX = os.getenv("USE_SANDBOX", "False").lower() == "true"
+CACHE_EXPIRY_DAYS = int(os.getenv("CACHE_EXPIRY_DAYS", "7"))
+
+# Phrases clean_description removes: case and bag details (any case), NOS (New Old
+# Stock), New and Retail
+_CLEAN_RE = re.compile(
+    r'(?i:w/\s+(?:Hardshell|Chipboard)?\s*Case|w/\s+Bag)|\bNOS\b|\bNew\b|\bRetail\b'
+)
+
+# Brands the simulated Reverb search recognizes, by priority when several appear
+BRANDS = ["fender", "gibson", "martin", "taylor", "prs", "ibanez", "epiphone",
+          "squier", "gretsch", "jackson", "charvel", "yamaha", "korg", "roland"]
+
+# Brands priced at the high end of each simulated range
+PREMIUM_GUITAR_BRANDS = frozenset({"gibson", "fender", "prs", "martin", "taylor"})
+PREMIUM_BASS_BRANDS = frozenset({"fender", "gibson"})
+PREMIUM_AMP_BRANDS = frozenset({"fender", "marshall", "vox", "mesa"})
+
+# Instrument type keywords for the simulated Reverb search (matched anywhere in the
+# lowercased description, like plain substring checks)
+_GUITAR_RE = re.compile(r'guitar|stratocaster|telecaster|les paul|sg')
+_AMP_RE = re.compile(r'amp')
+_PEDAL_RE = re.compile(r'pedal|effect|delay|distortion|overdrive')
+_KEYBOARD_RE = re.compile(r'keyboard|piano|synth|nord')
+_DRUM_RE = re.compile(r'drum|snare|cymbal|hi-hat|kick')
+
+
 class MarketScraper:
-    def __init__(self, cache_dir: str = "cache"):
-        """Initialize the market scraper with cache directory"""
+    def __init__(self, cache_dir: str = "cache", save_every: int = 50):
+        """Initialize the market scraper with cache directory
+        
+        New prices are written to the cache database in batches of save_every; call
+        flush() (or use the scraper as a context manager) to save the rest.
+        """
         # Set up cache directory
         self.cache_dir = cache_dir
         os.makedirs(cache_dir, exist_ok=True)
-        self.cache_file = os.path.join(cache_dir, "market_prices.json")
+        self.cache_file = os.path.join(cache_dir, "price_cache.db")
+        self.legacy_cache_file = os.path.join(cache_dir, "market_prices.json")
         
         # Reverb API settings - set these first
-        self.api_token = os.getenv("REVERB_API_TOKEN")
-        self.use_sandbox = os.getenv("USE_SANDBOX", "False").lower() == "true"
+        self.api_token = REVERB_API_TOKEN
+        self.use_sandbox = USE_SANDBOX
         self.base_domain = "sandbox.reverb.com" if self.use_sandbox else "api.reverb.com"
         self.base_url = f"https://{self.base_domain}/api"
-        self.cache_expiry_days = int(os.getenv("CACHE_EXPIRY_DAYS", "7"))
+        self.cache_expiry_days = CACHE_EXPIRY_DAYS
+        self.cache_expiry_seconds = self.cache_expiry_days * 86400
         
         # Now set up headers after API token is loaded
         self.headers = {
@@ -52,54 +93,121 @@ class MarketScraper:
             "Accept-Language": "en-US,en;q=0.9",
         }
         
-        # Load cache if it exists
-        self.price_cache = {}
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, 'r') as f:
-                self.price_cache = json.load(f)
+        # One session reuses connections across API requests; the lock guards the
+        # cache when lookups run on several threads
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Keep a pooled connection per lookup thread, and retry rate-limited or
+        # failed requests with backoff
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self._cache_lock = threading.Lock()
         
-        # Reverb API settings
-        self.api_token = os.getenv("REVERB_API_TOKEN")
-        self.use_sandbox = os.getenv("USE_SANDBOX", "False").lower() == "true"
-        self.base_domain = "sandbox.reverb.com" if self.use_sandbox else "api.reverb.com"
-        self.base_url = f"https://{self.base_domain}/api"
-        self.cache_expiry_days = int(os.getenv("CACHE_EXPIRY_DAYS", "7"))
+        # Open (or create) the SQLite cache; entries are read one key at a time, and
+        # new ones wait in _pending until the next batch is written
+        self.save_every = save_every
+        self._pending = {}
+        self.cache_con = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.cache_con.execute(
+            "CREATE TABLE IF NOT EXISTS price_cache (key TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._migrate_json_cache()
 
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+    
+    def _migrate_json_cache(self):
+        """Copy the entries of the old JSON cache file into an empty cache database"""
+        if not os.path.exists(self.legacy_cache_file):
+            return
+        if self.cache_con.execute("SELECT 1 FROM price_cache LIMIT 1").fetchone():
+            return
+        with open(self.legacy_cache_file, 'r') as f:
+            legacy_cache = json.load(f)
+        # The old AuctionAnalyzer wrote plain prices to the same file; only result
+        # dicts are scraper entries
+        with self.cache_con:
+            self.cache_con.executemany(
+                "INSERT OR REPLACE INTO price_cache (key, data) VALUES (?, ?)",
+                (
+                    (key, json.dumps(data))
+                    for key, data in legacy_cache.items()
+                    if isinstance(data, dict)
+                ),
+            )
+    
+    def get_cached_price(self, cache_key: str) -> Optional[dict]:
+        """Return the cached result for cache_key, or None when there is none"""
+        with self._cache_lock:
+            if cache_key in self._pending:
+                return self._pending[cache_key]
+            row = self.cache_con.execute(
+                "SELECT data FROM price_cache WHERE key = ?", (cache_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    
     def save_cache(self):
-        """Save the price cache to file"""
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.price_cache, f)
+        """Write the pending prices to the cache database"""
+        with self._cache_lock:
+            # One transaction per batch; each entry only touches its own row
+            with self.cache_con:
+                self.cache_con.executemany(
+                    "INSERT OR REPLACE INTO price_cache (key, data) VALUES (?, ?)",
+                    ((key, json.dumps(data)) for key, data in self._pending.items()),
+                )
+            self._pending.clear()
     
-    def clean_description(self, description: str) -> str:
-        """Clean item description to get better search results"""
-        # Remove case details and other common phrases
-        cleaned = re.sub(r'w/\s+(Hardshell|Chipboard)?\s*Case', '', description, flags=re.IGNORECASE)
-        cleaned = re.sub(r'w/\s+Bag', '', cleaned, flags=re.IGNORECASE)
-        cleaned = re.sub(r'\bNOS\b', '', cleaned)  # New Old Stock
-        cleaned = re.sub(r'\bNew\b', '', cleaned)
-        cleaned = re.sub(r'\bRetail\b', '', cleaned)
-        return cleaned.strip()
+    def flush(self):
+        """Save the price cache if it holds prices not yet written to the database"""
+        if self._pending:
+            self.save_cache()
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def clean_description(description: str) -> str:
+        """Clean item description to get better search results
+        
+        Memoized, since each lookup cleans the same description for its cache key and
+        again for the search itself.
+        """
+        # Remove case details and other common phrases in a single pass
+        return _CLEAN_RE.sub('', description).strip()
+    
+    def cache_key(self, description: str) -> str:
+        """Normalize a description into its price cache key"""
+        # Collapse the gaps left by removed words so near-duplicate lots share a key
+        return " ".join(self.clean_description(description).lower().split())
     
     def get_market_price(self, item_description: str, refresh_cache=False) -> dict:
         """Get market price for an item using Reverb API or simulation"""
         # Check cache first if not forcing refresh
-        cache_key = self.clean_description(item_description).lower()
+        cache_key = self.cache_key(item_description)
         
-        if not refresh_cache and cache_key in self.price_cache:
-            cached_data = self.price_cache[cache_key]
+        cached_data = None if refresh_cache else self.get_cached_price(cache_key)
+        if isinstance(cached_data, dict):
             # Check if cache is still valid based on expiry setting
             timestamp = cached_data.get("timestamp")
-            if timestamp:
-                # Ensure timestamp is a string before parsing
-                if not isinstance(timestamp, str):
-                    timestamp = str(timestamp)
+            if isinstance(timestamp, str):
+                # Entries cached before timestamps were epoch seconds hold ISO strings
                 try:
-                    cache_date = datetime.fromisoformat(timestamp)
-                    if datetime.now() - cache_date < timedelta(days=self.cache_expiry_days):
-                        return cached_data
-                except (ValueError, TypeError):
+                    timestamp = datetime.fromisoformat(timestamp).timestamp()
+                except ValueError:
                     # If timestamp parsing fails, continue to fetch new data
-                    pass
+                    timestamp = None
+            if isinstance(timestamp, (int, float)) and time.time() - timestamp < self.cache_expiry_seconds:
+                return cached_data
         
         # Try Reverb API first if token exists
         result = None
@@ -114,9 +222,10 @@ class MarketScraper:
         # Fall back to simulated data if API fails or no token
         if not result:
             print(f"Using simulated price data for: {item_description}")
-            reverb_price = self.search_reverb(item_description)  # Simulated
-            ebay_price = self.search_ebay(item_description)      # Simulated
-            sweetwater_price = self.search_sweetwater(item_description)  # Simulated
+            # Simulated; the eBay and Sweetwater prices derive from this one Reverb price
+            reverb_price = self.search_reverb(item_description)
+            ebay_price = self.search_ebay(item_description, reverb_price)
+            sweetwater_price = self.search_sweetwater(item_description, reverb_price)
             
             # Calculate weighted average (giving more weight to Reverb for musical instruments)
             prices = [p for p in [reverb_price, ebay_price, sweetwater_price] if p is not None]
@@ -132,16 +241,34 @@ class MarketScraper:
                         "sweetwater": sweetwater_price
                     },
                     "source_type": "simulation",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": time.time()
                 }
         
-        # Store result in cache if we got one
+        # Store result in cache if we got one; pending results are written once per batch
         if result:
-            self.price_cache[cache_key] = result
-            self.save_cache()
+            with self._cache_lock:
+                self._pending[cache_key] = result
+                save = len(self._pending) >= self.save_every
+            if save:
+                self.save_cache()
         
         return result
 
+    def get_market_prices(self, descriptions: List[str], max_workers: int = 10) -> Dict[str, dict]:
+        """Get market prices for many items at once, keyed by cache key
+        
+        Each distinct cache key is looked up once. The lookups are network-bound, so
+        they run concurrently, and the new prices are saved together at the end.
+        """
+        lookups = {}
+        for description in descriptions:
+            lookups.setdefault(self.cache_key(description), description)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = dict(zip(lookups, executor.map(self.get_market_price, lookups.values())))
+        self.flush()
+        return results
+
     def search_reverb_api(self, item_description: str, max_results=10) -> dict:
         """Search Reverb.com for market prices using the official API"""
         # Clean up item description for better search results
@@ -155,11 +282,11 @@ class MarketScraper:
             # Make API request to search listings
             url = f"{self.base_url}/listings"
             params = {
-                "query": quote_plus(query),
+                "query": query,
                 "per_page": max_results
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -188,16 +315,12 @@ class MarketScraper:
                             urls.append(url)
                     
                     if prices:
-                        # Calculate statistics
-                        prices.sort()  # For median calculation
-                        median_index = len(prices) // 2
-                        median = prices[median_index] if len(prices) % 2 == 1 else (prices[median_index-1] + prices[median_index]) / 2
+                        # Calculate statistics; prices stays in listing order so the
+                        # samples below keep each price with its own title
+                        median = statistics.median(prices)
                         
                         # Analyze conditions
-                        condition_counts = {}
-                        for condition in conditions:
-                            if condition:
-                                condition_counts[condition] = condition_counts.get(condition, 0) + 1
+                        condition_counts = dict(Counter(c for c in conditions if c))
                         
                         # Format sample listings
                         samples = []
@@ -219,7 +342,7 @@ class MarketScraper:
                             "conditions": condition_counts,
                             "sample_listings": samples,
                             "source_type": "reverb_api",
-                            "timestamp": datetime.now().isoformat()
+                            "timestamp": time.time()
                         }
             
             print(f"API request failed with status code: {response.status_code}")
@@ -237,21 +360,19 @@ class MarketScraper:
         cleaned = self.clean_description(item_description).lower()
         
         # Extract brand and instrument type
-        brands = ["fender", "gibson", "martin", "taylor", "prs", "ibanez", "epiphone", 
-                 "squier", "gretsch", "jackson", "charvel", "yamaha", "korg", "roland"]
-        brand = next((b for b in brands if b in cleaned), None)
+        brand = next((b for b in BRANDS if b in cleaned), None)
         
-        is_guitar = any(x in cleaned for x in ["guitar", "stratocaster", "telecaster", "les paul", "sg"])
+        is_guitar = bool(_GUITAR_RE.search(cleaned))
         is_acoustic = "acoustic" in cleaned
         is_bass = "bass" in cleaned
-        is_amp = any(x in cleaned for x in ["amp", "amplifier"])
-        is_pedal = any(x in cleaned for x in ["pedal", "effect", "delay", "distortion", "overdrive"])
-        is_keyboard = any(x in cleaned for x in ["keyboard", "piano", "synth", "synthesizer", "nord"])
-        is_drum = any(x in cleaned for x in ["drum", "snare", "cymbal", "hi-hat", "kick"])
+        is_amp = bool(_AMP_RE.search(cleaned))
+        is_pedal = bool(_PEDAL_RE.search(cleaned))
+        is_keyboard = bool(_KEYBOARD_RE.search(cleaned))
+        is_drum = bool(_DRUM_RE.search(cleaned))
         
         # Base price depends on instrument type and brand
         if is_guitar:
-            if brand in ['gibson', 'fender', 'prs', 'martin', 'taylor']:
+            if brand in PREMIUM_GUITAR_BRANDS:
                 base_price = random.uniform(800, 3000)
             else:
                 base_price = random.uniform(300, 1200)
@@ -260,13 +381,13 @@ class MarketScraper:
                 base_price *= 1.2  # Acoustic guitars often cost a bit more
                 
         elif is_bass:
-            if brand in ['fender', 'gibson']:
+            if brand in PREMIUM_BASS_BRANDS:
                 base_price = random.uniform(700, 1800)
             else:
                 base_price = random.uniform(250, 900)
                 
         elif is_amp:
-            if brand in ['fender', 'marshall', 'vox', 'mesa']:
+            if brand in PREMIUM_AMP_BRANDS:
                 base_price = random.uniform(500, 2200)
             else:
                 base_price = random.uniform(200, 800)
@@ -293,19 +414,21 @@ class MarketScraper:
         
         return round(final_price, 2)
 
-    def search_ebay(self, query: str) -> Optional[float]:
-        """Search eBay for prices (simulated for demo)"""
+    def search_ebay(self, query: str, reverb_price: Optional[float] = None) -> Optional[float]:
+        """Search eBay for prices (simulated for demo), relative to reverb_price when given"""
         # Simulate a slight price difference from Reverb
-        reverb_price = self.search_reverb(query)
+        if reverb_price is None:
+            reverb_price = self.search_reverb(query)
         if reverb_price:
             # eBay prices tend to be a bit lower
             return round(reverb_price * random.uniform(0.85, 0.95))
         return None
     
-    def search_sweetwater(self, query: str) -> Optional[float]:
-        """Search Sweetwater for prices (simulated for demo)"""
+    def search_sweetwater(self, query: str, reverb_price: Optional[float] = None) -> Optional[float]:
+        """Search Sweetwater for prices (simulated for demo), relative to reverb_price when given"""
         # Simulate retail prices (generally higher and more consistent)
-        reverb_price = self.search_reverb(query)
+        if reverb_price is None:
+            reverb_price = self.search_reverb(query)
         if reverb_price:
             # Retail prices tend to be higher and more standardized
             return round(reverb_price * random.uniform(1.1, 1.3))
@@ -314,7 +437,6 @@ class MarketScraper:
 
 # Example usage
 if __name__ == "__main__":
-    scraper = MarketScraper()
     test_items = [
         "Gibson Les Paul Standard",
         "Fender Stratocaster",
@@ -322,8 +444,10 @@ if __name__ == "__main__":
         "Taylor 814ce"
     ]
     
-    for item in test_items:
-        print(f"Finding market price for: {item}")
-        result = scraper.get_market_price(item)
-        print(f"Results: {json.dumps(result, indent=2)}")
-        print("---")
+    with MarketScraper() as scraper:
+        results = scraper.get_market_prices(test_items)
+        for item in test_items:
+            print(f"Market price for: {item}")
+            result = results[scraper.cache_key(item)]
+            print(f"Results: {json.dumps(result, indent=2)}")
+            print("---")
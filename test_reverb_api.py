@@ -62,9 +62,12 @@ def clear_cache():
         return
     
     count = 0
-    for file in cache_dir.glob("*.json"):
-        file.unlink()
-        count += 1
+    # The CLI's saved analyses hold prices from the old cache as well
+    for file in [*cache_dir.glob("*.json"), cache_dir / "price_cache.db",
+                 *cache_dir.glob("analysis_*.duckdb")]:
+        if file.exists():
+            file.unlink()
+            count += 1
     
     print(f"Cleared {count} cache files")
 
@@ -127,6 +130,8 @@ def format_market_data(result, verbose=False, sample_count=5):
     # Cache information
     if verbose and 'timestamp' in result:
         cache_time = result.get("timestamp", "Unknown")
+        if isinstance(cache_time, (int, float)):
+            cache_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cache_time))
         output.append(f"\n  Cache timestamp: {cache_time}")
     
     # Sample listings
@@ -149,6 +154,10 @@ def test_api(custom_search=None, clear_cache_first=False, verbose=False, sample_
     if not validate_api_token():
         return False
     
+    # Clear cache if requested (before the scraper opens the cache database)
+    if clear_cache_first:
+        clear_cache()
+    
     # Create scraper
     try:
         scraper = MarketScraper()
@@ -156,10 +165,6 @@ def test_api(custom_search=None, clear_cache_first=False, verbose=False, sample_
         print(f"\n❌ ERROR: Failed to initialize MarketScraper: {e}")
         return False
     
-    # Clear cache if requested
-    if clear_cache_first:
-        clear_cache()
-    
     # If custom search is provided, only test that
     if custom_search:
         test_items = [custom_search]
@@ -207,6 +212,9 @@ def test_api(custom_search=None, clear_cache_first=False, verbose=False, sample_
         except Exception as e:
             print(f"❌ ERROR: Search failed with exception: {e}")
     
+    # Save any prices the scraper has not written to the cache yet
+    scraper.flush()
+    
     # Print summary
     print(f"\n{'-'*50}")
     print("Test Summary:")